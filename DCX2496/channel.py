@@ -1,6 +1,8 @@
 from enum import IntEnum
+from functools import lru_cache
 
 
+@lru_cache(maxsize=4096)
 def _map_numbers(s_min, s_max, t_min, t_max, value):
     return round(
         ((t_max - t_min) * max(min(value, s_max), s_min) + (t_min * s_max) - (s_min * t_max)) / (s_max - s_min)
@@ -8,7 +10,13 @@ def _map_numbers(s_min, s_max, t_min, t_max, value):
 
 
 def _15db_range(value):
-    return _map_numbers(-15.0, 15.0, 0.0, 300.0, value)
+    # Same as _map_numbers(-15.0, 15.0, 0.0, 300.0, value), rounded to the 0.1 dB resolution of the device
+    return min(max(round(value * 10), -150), 150) + 150
+
+
+def _15db_value(value):
+    # Inverse of _15db_range
+    return round(value / 10.0 - 15.0, 1)
 
 
 class Channel(IntEnum):
@@ -33,6 +41,8 @@ class InputChannel:
     Class representing a device channel object
     """
 
+    __slots__ = ("channel", "_device", "gain", "muted", "level", "limited")
+
     def __init__(self, channel: Channel, device):
         self.channel = channel
         self._device = device
@@ -70,7 +80,7 @@ class InputChannel:
         :param value: delay in meters [0, 200], step: 0.05m
         """
         # 0 ... 200m -> values 0 ... 4000 (= step of 5cm)
-        self._invoke(0x05, _map_numbers(0.0, 200.0, 0.0, 4000.0))
+        self._invoke(0x05, _map_numbers(0.0, 200.0, 0.0, 4000.0, value))
 
     def send(self):
         """
@@ -86,13 +96,17 @@ class InputChannel:
 
 
 class OutputChannel(InputChannel):
+    __slots__ = ()
+
     def set_source(self, channel: Channel):
         """
         Set source of the output channel
         :param channel: Channel A ... SUM
         """
-        assert Channel.INPUT_A <= channel <= Channel.INPUT_SUM
-        self._invoke(0x41, int(channel - Channel.INPUT_A))  # 0 ... 3 = A ... SUM
+        source = int(channel) - Channel.INPUT_A  # 0 ... 3 = A ... SUM
+        if not 0 <= source <= 3:
+            raise ValueError(f"Invalid source channel {channel}, valid are INPUT_A ... INPUT_SUM")
+        self._invoke(0x41, source)
 
     def set_polarity(self, inverse=False):
         """
@@ -107,11 +121,11 @@ class OutputChannel(InputChannel):
         :param phase: phase in deg 0 ... 180 (step 5 deg)
         :return:
         """
-        self._invoke(0x4A, _map_numbers(0, 180, 0, 36))  # 0 ... 36
+        self._invoke(0x4A, _map_numbers(0, 180, 0, 36, phase))  # 0 ... 36
 
     def set_short_delay(self, value=True):
         """
         Set the short delay of an output channel.
         :param value: delay in millimeters [0, 4000], step: 2mm
         """
-        self._invoke(0x4B, _map_numbers(0.0, 4000.0, 0.0, 2000.0))
+        self._invoke(0x4B, _map_numbers(0.0, 4000.0, 0.0, 2000.0, value))
@@ -1,15 +1,62 @@
 import socket
 import serial
 import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 
 from .constants import FunctionBytes, FUNCTION_BYTE
 from .exceptions import DCXSerialException, DCXConnectorException
 from .logger import logger
 from .responses import SearchResponse, PingResponse, DumpResponse, Response
 
+_UNIX_RE = re.compile(r"unix://(.+)")
+_HOSTPORT_RE = re.compile(r":(\d\d+)$")
+_REGISTRY_LOCK = threading.Lock()
+
 
 class Connector:
-    HAVE_RESPONSE = [FunctionBytes.SEARCH, FunctionBytes.PING, FunctionBytes.DUMP]
+    HAVE_RESPONSE = frozenset((FunctionBytes.SEARCH, FunctionBytes.PING, FunctionBytes.DUMP))
+
+    RECEIVE_BUFFER_SIZE = 4096
+    """Initial size of the receive buffer, large enough for a complete DUMP part"""
+
+    RESPONSE_TYPES = [Response] * 256
+    """Response class by function byte of the response"""
+    RESPONSE_TYPES[0x00] = SearchResponse
+    RESPONSE_TYPES[0x04] = PingResponse
+    RESPONSE_TYPES[0x10] = DumpResponse
+
+    def __init__(self):
+        # Single worker, so submitted commands are handled in submit order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pyDCX")
+        self._worker: threading.Thread = None
+        self._submit_lock = threading.Lock()
+        self._last_submitted: Future = None
+
+    def submit(self, command) -> Future:
+        """
+        Queue a command for sending without waiting for it.
+        Commands are handled one after another (in submit order) by a worker thread of the connector.
+        :param command: DCX command bytes
+        :return: Future resolving to the result of handle_command
+        """
+        with self._submit_lock:
+            self._last_submitted = self._executor.submit(self._handle_submitted, command)
+            return self._last_submitted
+
+    def wait_submitted(self):
+        """
+        Wait until all submitted commands are handled.
+        Call before handle_command to keep the order with previously submitted commands.
+        Does not wait when called from the worker, e.g. from a done callback of a submitted command.
+        """
+        last = self._last_submitted
+        if last is not None and threading.current_thread() is not self._worker:
+            wait((last,))
+
+    def _handle_submitted(self, command):
+        self._worker = threading.current_thread()
+        return self.handle_command(command)
 
     def handle_command(self, command):
         """
@@ -27,14 +74,13 @@ class Connector:
         pass
 
     def close(self):
-        pass
+        self._executor.shutdown()
 
     def get_response(self):
         data = self.read_response()
         if len(data) < FUNCTION_BYTE + 1:
             raise DCXConnectorException("Invalid response (too short) read")
-        response_type = {0x00: SearchResponse, 0x04: PingResponse, 0x10: DumpResponse}
-        return response_type.get(data[FUNCTION_BYTE], Response)(data)
+        return self.RESPONSE_TYPES[data[FUNCTION_BYTE]](data)
 
 
 class DaemonConnector(Connector):
@@ -57,22 +103,23 @@ class DaemonConnector(Connector):
             - Hostname `localhost:1234`
         :param connection: String defining the interface
         """
-        unix = re.compile(r"unix://(.+)")
-        host_port = re.compile(r":(\d\d+)$")
+        super().__init__()
+        # Receive buffer reused for all responses, grown on demand
+        self._rx = bytearray(self.RECEIVE_BUFFER_SIZE)
+        self._rx_view = memoryview(self._rx)
 
-        match = unix.match(connection)
+        match = _UNIX_RE.match(connection)
         if match:
-            logger.debug(f"Daemon connector on UNIX socket {match.group()}")
+            logger.debug("Daemon connector on UNIX socket %s", match.group())
             addresses = [(socket.AF_UNIX, socket.SOCK_STREAM, 0, "", match.group())]
         else:
-            port = host_port.search(connection)
+            port = _HOSTPORT_RE.search(connection)
             if port:
                 port = port.groups()[0]
                 connection = connection[: -(len(port) + 1)]
             else:
                 port = 4444
-            print(f"Daemon connector on TCP socket {connection} port {port}")
-            logger.debug(f"Daemon connector on TCP socket {connection} port {port}")
+            logger.debug("Daemon connector on TCP socket %s port %s", connection, port)
             addresses = socket.getaddrinfo(connection, port, socket.AF_UNSPEC, socket.SOCK_STREAM)
             if not addresses:
                 raise DCXConnectorException
@@ -96,6 +143,7 @@ class DaemonConnector(Connector):
             raise DCXSerialException("Could not open socket for daemon communication")
 
     def close(self):
+        super().close()
         self.sock.close()
 
     def write_command(self, command: bytearray):
@@ -106,14 +154,20 @@ class DaemonConnector(Connector):
 
     def read_response(self):
         EOL = b"\xF7"
-        data = bytearray()
+        offset = 0
         while True:
-            buf = self.sock.recv(256)
-            if buf:
-                data.extend(buf)
-                if EOL in buf:
-                    break
-        return data
+            if offset == len(self._rx):
+                # Buffer exhausted, the view must be released before the bytearray can be resized
+                self._rx_view.release()
+                self._rx.extend(bytes(len(self._rx)))
+                self._rx_view = memoryview(self._rx)
+            received = self.sock.recv_into(self._rx_view[offset:])
+            if not received:
+                break
+            offset += received
+            if self._rx.find(EOL, offset - received, offset) != -1:
+                break
+        return bytearray(self._rx_view[:offset])
 
 
 class SerialConnector(Connector):
@@ -121,8 +175,53 @@ class SerialConnector(Connector):
     Helper for serial data communication
     """
 
+    _REGISTRY: "dict[str, SerialConnector]" = {}
+    """Open connectors by serial port, see get"""
+
+    @classmethod
+    def get(cls, serial_port):
+        """
+        Get the connector of a serial port, the port is only opened once per process.
+        Use this if multiple devices are connected to the same port.
+        Every call must be paired with a call of close, the port is closed when the last user closed it.
+        :param serial_port: Serial port
+        :return: SerialConnector
+        """
+        with _REGISTRY_LOCK:
+            connector = cls._REGISTRY.get(serial_port)
+            if connector is None:
+                connector = cls._REGISTRY[serial_port] = cls(serial_port)
+            connector._users += 1
+            return connector
+
     def __init__(self, serial_port):
+        super().__init__()
         self.serial = serial.Serial(serial_port, baudrate=38400)
+        self._serial_port = serial_port
+        # Number of get calls not yet paired with close, 0 if not created by get
+        self._users = 0
+        # Serializes command / response pairs of devices sharing this connector
+        self._lock = threading.Lock()
+        # Receive buffer reused for all responses, grown on demand
+        self._rx = bytearray(self.RECEIVE_BUFFER_SIZE)
+        # Number of buffered bytes in _rx not yet returned by read_response
+        self._rx_length = 0
+
+    def close(self):
+        with _REGISTRY_LOCK:
+            if self._users > 1:
+                # Still used by others
+                self._users -= 1
+                return
+            self._users = 0
+            if self._REGISTRY.get(self._serial_port) is self:
+                del self._REGISTRY[self._serial_port]
+        super().close()
+        self.serial.close()
+
+    def handle_command(self, command):
+        with self._lock:
+            return super().handle_command(command)
 
     def write_command(self, command):
         written = self.serial.write(command)
@@ -131,13 +230,28 @@ class SerialConnector(Connector):
 
     def read_response(self):
         EOL = b"\xF7"
-        data = bytearray()
-        while True:
-            c = self.serial.read(1)
-            if c:
-                data += c
-                if data[-1:] == EOL:
-                    break
-            else:
+        # Bytes received after the terminator of the previous response are already buffered
+        offset = self._rx_length
+        end = self._rx.find(EOL, 0, offset)
+        while end == -1:
+            # Read everything already buffered by the driver, at least one byte (blocks until available)
+            buf = self.serial.read(max(1, self.serial.in_waiting))
+            if not buf:
                 break
+            new_offset = offset + len(buf)
+            if new_offset > len(self._rx):
+                self._rx.extend(bytes(max(len(self._rx), new_offset - len(self._rx))))
+            self._rx[offset:new_offset] = buf
+            idx = buf.find(EOL)
+            if idx != -1:
+                end = offset + idx
+            offset = new_offset
+        if end == -1:
+            # Nothing more to read, return what was received
+            self._rx_length = 0
+            return self._rx[:offset]
+        # Cut at the terminator, keep the following bytes for the next read
+        data = self._rx[: end + 1]
+        self._rx_length = offset - end - 1
+        self._rx[: self._rx_length] = self._rx[end + 1 : offset]
         return data
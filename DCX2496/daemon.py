@@ -2,23 +2,39 @@ import argparse
 import re
 import time
 
-import select
+import selectors
 import socket
+import threading
 from os import path, remove
 from configparser import ConfigParser
 
 from DCX2496.connector import SerialConnector
-from DCX2496.constants import FUNCTION_BYTE, FunctionBytes, TERMINATOR_BYTE
+from DCX2496.constants import DCX_HEADER, FUNCTION_BYTE, SEPARATOR_BYTE, FunctionBytes, TERMINATOR_BYTE
+from DCX2496.logger import logger
+
+_UNIX_RE = re.compile(r"unix://(.+)")
+
+
+class _ClientState:
+    """Buffered in- and output of a client connection"""
+
+    __slots__ = ("inbuf", "outbuf")
+
+    def __init__(self):
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
 
 
 class DCXDaemon:
     server: socket.socket = None
     connections = {}
-    dump_cache = ((0, None), (0, None))
+
+    REFRESH_AHEAD = 0.1
+    """Fraction of the cache timeout before expiry at which requested DUMPs are refreshed in the background"""
 
     def __init__(self, serial_port, host, port, cache: int = None):
-        self.connector = SerialConnector(serial_port)
-        match = re.match(r"unix://(.+)", host)
+        self.connector = SerialConnector.get(serial_port)
+        match = _UNIX_RE.match(host)
         if match:
             addresses = [(socket.AF_UNIX, socket.SOCK_STREAM, 0, "", match.group())]
             if path.exists(match.group()):
@@ -45,57 +61,125 @@ class DCXDaemon:
             print(f"Could not open socket on {host}")
             exit(1)
         self.caching = cache
-        self.connections = {self.server: tuple()}
+        self.connections = {}
+        # Cached DUMP responses as [timestamp, DumpResponse, last request],
+        # keyed by the DUMP command (device ID and part)
+        self.dump_cache = {}
+        # epoll / kqueue where available, only sockets with pending output are watched for writing
+        self._sel = selectors.DefaultSelector()
+        self._sel.register(self.server, selectors.EVENT_READ)
 
     def run(self):
+        # Local aliases, the loop runs for every socket event
+        sel = self._sel
+        server = self.server
+        connections = self.connections
+        read_client = self.read_client
+        write_client = self.write_client
+        EVENT_READ, EVENT_WRITE = selectors.EVENT_READ, selectors.EVENT_WRITE
+        if self.caching:
+            threading.Thread(target=self._refresh_dump_cache, daemon=True).start()
         while True:
-            readable, writeable, _ = select.select(self.connections.keys(), self.connections.keys(), [], 60)
-            for sock in readable:
-                if sock is self.server:
+            for key, mask in sel.select(timeout=60):
+                sock = key.fileobj
+                if sock is server:
                     conn, _ = sock.accept()
-                    self.connections[conn] = [bytearray(), bytearray()]
-                else:
-                    self.read_client(sock)
-            for sock in writeable:
-                try:
-                    self.write_client(sock)
-                except:
-                    sock.close()
-                    del self.connections[sock]
-
-    def read_client(self, sock):
+                    state = _ClientState()
+                    connections[conn] = state
+                    sel.register(conn, EVENT_READ, state)
+                    continue
+                if mask & EVENT_READ:
+                    read_client(sock, key.data)
+                if mask & EVENT_WRITE and sock in connections:
+                    try:
+                        write_client(sock, key.data)
+                    except OSError:
+                        self.close_client(sock)
+
+    def close_client(self, sock):
+        self._sel.unregister(sock)
+        del self.connections[sock]
+        sock.close()
+
+    def read_client(self, sock, state: _ClientState):
         data = sock.recv(1024)
         if not data:
-            del self.connections[sock]
-            sock.close()
+            self.close_client(sock)
         else:
-            self.connections[sock][0].extend(data)
-            if len(self.connections[sock][0]) >= 8 and TERMINATOR_BYTE in self.connections[sock][0]:
-                idx = self.connections[sock][0].find(TERMINATOR_BYTE, 7)
-                command = self.connections[sock][0][0 : idx + 1]
-                self.connections[sock][0] = self.connections[sock][0][idx:-1]
-                resp = self.handle_command(command)
-                self.connections[sock][1].extend(resp.data if resp else b"\xF7")
-                self.connections[sock][0].clear()
-
-    def write_client(self, sock):
-        if self.connections[sock][1]:
-            sock.sendall(self.connections[sock][1])
-            self.connections[sock][1].clear()
+            inbuf, outbuf = state.inbuf, state.outbuf
+            handle_command = self.handle_command
+            inbuf.extend(data)
+            # Handle all complete commands, a client might have sent more than one
+            while len(inbuf) >= 8:
+                idx = inbuf.find(TERMINATOR_BYTE, 7)
+                if idx == -1:
+                    break
+                resp = handle_command(bytes(inbuf[: idx + 1]))
+                del inbuf[: idx + 1]
+                # Clients only read a response for commands which have one, see Connector.handle_command
+                if resp:
+                    outbuf.extend(resp.data)
+                    self._sel.modify(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, state)
+
+    def write_client(self, sock, state: _ClientState):
+        outbuf = state.outbuf
+        if outbuf:
+            sock.sendall(outbuf)
+            outbuf.clear()
+        # Nothing left to send, stop watching for writability to not spin on an always writable socket
+        self._sel.modify(sock, selectors.EVENT_READ, state)
 
     def handle_command(self, command):
         if self.caching and command[FUNCTION_BYTE] == FunctionBytes.DUMP:
-            part = command[FUNCTION_BYTE + 3]
-            if self.dump_cache[part][0] > time.time() - self.caching:
-                return self.dump_cache[part][1]
-            else:
-                resp = self.connector.handle_command(command)
-                self.dump_cache[part][1] = resp
-                self.dump_cache[part][0] = time.time()
-                return resp
+            return self._cached_dump(bytes(command))
         else:
             return self.connector.handle_command(command)
 
+    def get_dump(self, part, device_id=0):
+        """
+        Get a DUMP part of a device, for in-process users of the daemon.
+        The response is served from the cache if caching is enabled and the entry is not expired.
+        :param part: Data part 0 or 1
+        :param device_id: DCX device ID (0 - 15)
+        :return: DumpResponse
+        """
+        command = DCX_HEADER + bytes((device_id, SEPARATOR_BYTE, FunctionBytes.DUMP, 0x01, 0x00, part, TERMINATOR_BYTE))
+        if not self.caching:
+            return self.connector.handle_command(command)
+        return self._cached_dump(command)
+
+    def _cached_dump(self, command: bytes):
+        # The connector already returns the parsed DumpResponse, so hits neither touch the serial port nor reparse
+        now = time.time()
+        entry = self.dump_cache.get(command)
+        if entry is None or entry[0] <= now - self.caching:
+            entry = [now, self.connector.handle_command(command), now]
+            self.dump_cache[command] = entry
+        else:
+            entry[2] = now
+        return entry[1]
+
+    def _refresh_dump_cache(self):
+        # Runs in a background thread, the serial connector serializes access to the port.
+        # Entries requested again since their last fetch are refreshed shortly before they expire,
+        # so clients keep hitting the cache. Entries not requested within the last cache period are dropped.
+        while True:
+            time.sleep(self.caching * self.REFRESH_AHEAD)
+            now = time.time()
+            for command, entry in list(self.dump_cache.items()):
+                if entry[2] <= now - self.caching:
+                    self.dump_cache.pop(command, None)
+                elif entry[2] > entry[0] and entry[0] <= now - self.caching * (1 - self.REFRESH_AHEAD):
+                    try:
+                        response = self.connector.handle_command(command)
+                    except Exception:
+                        # Keep refreshing the other entries, this one is fetched again on the next request
+                        logger.exception("Could not refresh cached DUMP %s", command.hex())
+                        self.dump_cache.pop(command, None)
+                        continue
+                    entry[1] = response
+                    entry[0] = time.time()
+
 
 def run_daemon():
     # Parse config flag
@@ -1,15 +1,40 @@
+import struct
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import lru_cache
 from typing import Union, Optional
-from logging import getLogger
 from enum import IntEnum
 
-from .channel import Channel, InputChannel, OutputChannel, _15db_range
+from .channel import Channel, InputChannel, OutputChannel, _15db_range, _15db_value
 from .connector import SerialConnector, DaemonConnector
-from .constants import DCX_HEADER, FunctionBytes, OutputConfiguration, TransmitMode
-from .dump_lut import dump_lut
+from .constants import DCX_HEADER, SEPARATOR_BYTE, TERMINATOR_BYTE, FunctionBytes, OutputConfiguration, TransmitMode
+from .dump_lut import dump_table
+from .exceptions import DCXConnectorException
+from .logger import logger
 from .responses import DumpResponse
 
-logger = getLogger("pyDCX")
-logger.setLevel("DEBUG")
+_BYTES = [bytes((i,)) for i in range(256)]
+"""Single byte objects by value, avoids creating them on every frame"""
+
+_COMMAND_STRUCT = struct.Struct("BBBB")
+"""Command in a COMMAND frame: channel, parameter, value high bits, value low 7 bits"""
+
+
+@lru_cache(maxsize=8192)
+def _encode_command(channel: int, parameter: int, value: int) -> bytes:
+    # The command space is small (channels x parameters x values), so most commands are served from the cache
+    return _COMMAND_STRUCT.pack(channel, parameter, (value >> 7) & 0xFF, value & 0x7F)
+
+
+# Plain int channel numbers for the command hot path, avoids IntEnum operator dispatch
+_SETUP = int(Channel.SETUP)
+_INPUT_A = int(Channel.INPUT_A)
+
+_SEARCH_FRAME = DCX_HEADER + bytes((0x20, SEPARATOR_BYTE, FunctionBytes.SEARCH, TERMINATOR_BYTE))
+"""SEARCH is sent to the broadcast device ID 0x20, so the frame is the same for all devices"""
+
+_DUMP_CONVERSION = {"gain": _15db_value}
+"""Conversion of raw dump values to the unit used by the setters"""
 
 
 class Device:
@@ -19,38 +44,48 @@ class Device:
         :param device_id: Set the DCX device ID (valid 0 - 15, displayed as +1)
         :param connection: Serial port or network address
         """
-        assert 0 <= device_id < 16
         self.batch_mode = batch_mode
         self.device_id = device_id
-        self.channels: dict[Channel, Union[InputChannel, OutputChannel]] = {
-            **{
-                idx: InputChannel(channel=Channel(idx), device=self)
-                for idx in range(Channel.INPUT_A, Channel.INPUT_SUM + 1)
-            },
-            **{
-                idx: OutputChannel(channel=Channel(idx), device=self)
-                for idx in range(Channel.OUTPUT_1, Channel.OUTPUT_6 + 1)
-            },
-        }
+        # Indexed by channel number, Channel.SETUP (0) has no channel object
+        self.channels: list[Optional[Union[InputChannel, OutputChannel]]] = [None] * (Channel.OUTPUT_6 + 1)
+        for idx in range(Channel.INPUT_A, Channel.INPUT_SUM + 1):
+            self.channels[idx] = InputChannel(channel=Channel(idx), device=self)
+        for idx in range(Channel.OUTPUT_1, Channel.OUTPUT_6 + 1):
+            self.channels[idx] = OutputChannel(channel=Channel(idx), device=self)
+        # All channel objects in the order of PING status bytes (INPUT_A ... OUTPUT_6)
+        self._channels_list = self.channels[Channel.INPUT_A :]
         self._remote_mode = TransmitMode.RECEIVE
         if connection.startswith(("com", "COM", "/")):
-            self._connector = SerialConnector(connection)
+            self._connector = SerialConnector.get(connection)
         else:
             self._connector = DaemonConnector(connection)
         # For batch mode
         self.__commands = []
+        # Futures of submitted batches not yet checked by drain
+        self.__submitted: "list[Future]" = []
+
+    @property
+    def device_id(self):
+        """DCX device ID (valid 0 - 15, displayed as +1)"""
+        return self._device_id
+
+    @device_id.setter
+    def device_id(self, value):
+        if not 0 <= value < 16:
+            raise ValueError(f"Invalid device ID {value}, valid are 0 - 15")
+        self._device_id = value
+        # Frame header up to the function byte and complete frames of the fixed calls,
+        # only rebuilt when the device ID changes
+        self._header_prefix = DCX_HEADER + bytes((value, SEPARATOR_BYTE))
+        self._ping_frame = self.__frame(FunctionBytes.PING, b"\x00\x00")
+        self._dump_frames = tuple(self.__frame(FunctionBytes.DUMP, b"\x01\x00" + _BYTES[part]) for part in (0, 1))
 
     def search_device(self):
         """
         Search serial connection for DCX device
         :return: SearchResponse
         """
-        backup_id = self.device_id
-        self.device_id = 0x20
-        try:
-            return self.__do_call(FunctionBytes.SEARCH)
-        finally:
-            self.device_id = backup_id
+        return self.__send_frame(_SEARCH_FRAME)
 
     def transmit_mode(self, mode: Optional[TransmitMode] = None):
         """
@@ -62,19 +97,17 @@ class Device:
             return self._remote_mode
         else:
             self._remote_mode = mode
-            data = bytearray(bytes([mode]))
-            data.append(0x00)
-            return self.__do_call(FunctionBytes.TRANSMIT, data)
+            return self.__do_call(FunctionBytes.TRANSMIT, bytes((mode, 0x00)))
 
     def ping(self):
         """
         Get status of current DCX device
         :return: PingResponse
         """
-        response = self.__do_call(FunctionBytes.PING, b"\x00\x00")
-        for channel in self.channels.keys():
-            self.channels[channel].level = response.channels[channel].level
-            self.channels[channel].limited = response.channels[channel].limited
+        response = self.__send_frame(self._ping_frame)
+        for channel, level, limited in zip(self._channels_list, response.levels, response.limited):
+            channel.level = level
+            channel.limited = bool(limited)
         return response
 
     def dump(self, part=None):
@@ -89,17 +122,16 @@ class Device:
             self._parse_dump_with_lut(dr.payload)
             return dr
         else:
-            assert 0 <= part <= 1
-            data = bytearray(b"\x01\x00")
-            data.append(part)
-            return self.__do_call(FunctionBytes.DUMP, data)
+            if part not in (0, 1):
+                raise ValueError(f"Invalid dump part {part}, valid are 0 and 1")
+            return self.__send_frame(self._dump_frames[part])
 
     def set_out_configuration(self, configuration: OutputConfiguration):
         """
         OUT CONFIGURATION selects the general operating mode, see section 4.2.1 of the manual
         :param configuration: OutputConfiguration
         """
-        return self._invoke(0x05, Channel.SETUP, configuration.value)
+        return self._invoke(0x05, _SETUP, configuration)
 
     def enable_stereo_link(self, enable=True):
         """
@@ -108,7 +140,7 @@ class Device:
          See section 4.2.1 on page 8 of manual.
         :param enable: True to enable, False to disable
         """
-        return self._invoke(0x06, Channel.SETUP, int(enable))
+        return self._invoke(0x06, _SETUP, enable)
 
     def set_input_stereo_link(self, configuration: int):
         """
@@ -116,15 +148,16 @@ class Device:
         See section 4.2.1, page 9 of manual.
         :param configuration: 0 (disable), 1 (A+B), 2 (A+B+C), 3 (A+B+C+SUM)
         """
-        assert 0 <= configuration <= 3
-        return self._invoke(0x07, Channel.SETUP, configuration)
+        if not 0 <= configuration <= 3:
+            raise ValueError(f"Invalid input link configuration {configuration}, valid are 0 - 3")
+        return self._invoke(0x07, _SETUP, configuration)
 
     def mute_outputs(self, mute: bool = True):
         """
         Mute all outputs
         :param mute: True to mute, False to unmute
         """
-        return self._invoke(0x15, Channel.SETUP, int(mute))
+        return self._invoke(0x15, _SETUP, mute)
 
     def set_sum_input_gain(self, input_channel: Channel, gain: float):
         """
@@ -132,64 +165,126 @@ class Device:
         :param input_channel: A ... C
         :param gain: -15.0 .. 15.0 dB
         """
-        assert Channel.INPUT_A <= input_channel <= Channel.INPUT_C
-        return self._invoke(0x16 + input_channel - Channel.INPUT_A, Channel.SETUP, _15db_range(gain))
+        offset = int(input_channel) - _INPUT_A
+        if not 0 <= offset <= 2:
+            raise ValueError(f"Invalid SUM input channel {input_channel}, valid are INPUT_A ... INPUT_C")
+        return self._invoke(0x16 + offset, _SETUP, _15db_range(gain))
 
     def send(self):
         """
         When in batch mode, this will send the previous commands
         :return: self
         """
-        if len(self.__commands) > 0:
-            data = bytearray([len(self.__commands)])
-            for command in self.__commands:
-                data.extend(command)
-            self.__do_call(0x20, data)
-            self.__commands.clear()
+        frame = self.__batch_frame()
+        if frame is not None:
+            self.__send_frame(frame)
         return self
 
+    def submit(self) -> Future:
+        """
+        When in batch mode, this will send the previous commands without waiting for the transfer.
+        Commands are sent in submit order, so the next batch can be prepared while the previous one is sent.
+        Use drain to wait for all submitted batches.
+        :return: Future which is done as soon as the commands were sent
+        """
+        frame = self.__batch_frame()
+        if frame is None:
+            future = Future()
+            future.set_result(None)
+            return future
+        # Batches sent successfully need no check by drain anymore
+        self.__submitted = [f for f in self.__submitted if not f.done() or f.cancelled() or f.exception()]
+        future = self._connector.submit(frame)
+        self.__submitted.append(future)
+        return future
+
+    def drain(self):
+        """
+        Wait until all batches passed to submit are sent.
+        Called before every synchronous command, so a failed batch is not silently ignored.
+        From a done callback of a submitted batch only already finished batches are checked.
+        :raises Exception: First exception raised while sending a submitted batch
+        """
+        self._connector.wait_submitted()
+        error = None
+        pending = []
+        for future in self.__submitted:
+            if not future.done():
+                # Only when called from the worker, which can not wait for itself
+                pending.append(future)
+            elif error is None and not future.cancelled():
+                error = future.exception()
+        self.__submitted = pending
+        if error is not None:
+            raise error
+
+    @contextmanager
+    def batching(self):
+        """
+        Context in which batch mode is enabled, all commands are sent as one frame when leaving it.
+        If the context is left by an exception, the commands queued in it are discarded instead.
+        Example: `with device.batching(): ...` to set multiple parameters with a single serial write.
+        :return: self
+        """
+        backup_mode = self.batch_mode
+        self.batch_mode = True
+        # Commands queued before the context are not owned by it and are kept on errors
+        start = len(self.__commands)
+        try:
+            yield self
+        except BaseException:
+            # Do not send a half built batch
+            self.batch_mode = backup_mode
+            del self.__commands[start:]
+            raise
+        self.batch_mode = backup_mode
+        self.send()
+
     def _parse_dump_with_lut(self, dump):
-        for parameter in dump_lut.keys():
-            for channel in Channel:
-                if dump_lut[parameter][channel]:
-                    value = 0
-                    for idx, mapping in enumerate(dump_lut[parameter][channel]):
-                        shift = min(1, idx) * 7 + 1 * max(0, idx - 1)
-                        if isinstance(mapping, tuple):
-                            value += (dump[mapping[0]] & (1 << mapping[1])) << shift
-                        else:
-                            value += dump[mapping[0]] << shift
-                    if channel is not Channel.SETUP:
-                        self.channels[channel][parameter] = value
-                    else:
-                        self[parameter] = value
+        # SysEx data bytes never have the top bit set, isascii checks exactly that for all bytes at once
+        if not bytes(dump).isascii():
+            raise DCXConnectorException("Invalid dump read (byte with top bit set)")
+        for parameter, channel, fields in dump_table:
+            value = 0
+            for byte, bit, mask, shift in fields:
+                value |= ((dump[byte] >> bit) & mask) << shift
+            convert = _DUMP_CONVERSION.get(parameter)
+            if convert is not None:
+                value = convert(value)
+            setattr(self if channel is Channel.SETUP else self.channels[channel], parameter, value)
 
     def _invoke(self, parameter, channel, value):
-        logger.debug(f"Invoke command {value} on channel {channel} with parameter {parameter}")
-        print(f"Invoke command with parameter {parameter} on channel {channel} with data {value}")
-        data = self.__command(channel, parameter, value)
-        self.__commands.append(data)
+        """
+        Queue (batch mode) or send a command, shared by all setters of the device and its channels
+        :param parameter: Parameter byte
+        :param channel: Channel the parameter belongs to, Channel.SETUP for device wide settings
+        :param value: Raw value, bool and IntEnum values are converted to int
+        """
+        logger.debug("Invoke command %s on channel %s with parameter %s", value, channel, parameter)
+        # Values from the channel helpers are already int, only coerce floats / bools / enums
+        if value.__class__ is not int:
+            value = int(value)
+        self.__commands.append(_encode_command(channel, parameter, value))
         if self.batch_mode:
             return self
         else:
             self.send()
 
-    def __command(self, channel, parameter, value):
-        value = int(value)
-        value_low = value & 0x7F
-        value_high = (value >> 7) & 0xFF
-        b = bytearray(bytearray(bytes([channel])))
-        b.append(parameter)
-        b.append(value_high)
-        b.append(value_low)
-        return b
+    def __frame(self, function, data=None):
+        return b"".join((self._header_prefix, _BYTES[function], data or b"", _BYTES[TERMINATOR_BYTE]))
 
     def __do_call(self, function, data=None):
-        call = bytearray(DCX_HEADER)
-        call.append(self.device_id)
-        call.append(0x0E)
-        call.append(function)
-        if data is not None:
-            call.extend(data)
-        call.append(0xF7)
-        return self._connector.handle_command(call)
+        return self.__send_frame(self.__frame(function, data))
+
+    def __batch_frame(self):
+        if not self.__commands:
+            return None
+        # Queued commands are immutable bytes, so the payload is built with a single join
+        payload = b"".join((_BYTES[len(self.__commands)], *self.__commands))
+        self.__commands.clear()
+        return self.__frame(FunctionBytes.COMMAND, payload)
+
+    def __send_frame(self, frame):
+        # Synchronous, but ordered after batches still pending from submit
+        self.drain()
+        return self._connector.handle_command(frame)
@@ -1,3 +1,5 @@
+from .channel import Channel
+
 # ("parameter", [("7bits", "8bit", "9bit")])
 # 7bits: Byte containing 7bits of information, 8th bit is always 0
 # 8bit: Byte just containing the 8th bit... stupid but yes...
@@ -19,3 +21,27 @@ dump_lut = {
         (0x626, (0x62B, 2), (0x627, 0)),  # 6
     ],
 }
+
+
+def _compile_dump_lut():
+    # Flatten dump_lut to (parameter, channel, ((byte index, bit, mask, shift), ...)) once,
+    # so parsing a dump needs neither type checks nor shift calculations.
+    # The first byte holds the lower 7 bits, the following single bits are bit 7 and bit 8 of the value.
+    table = []
+    for parameter, channels in dump_lut.items():
+        for channel, mappings in zip(Channel, channels):
+            if not mappings:
+                continue
+            fields = []
+            for idx, mapping in enumerate(mappings):
+                shift = 6 + idx if idx else 0
+                if isinstance(mapping, tuple):
+                    fields.append((mapping[0], mapping[1], 0x01, shift))
+                else:
+                    fields.append((mapping, 0, 0xFF, shift))
+            table.append((parameter, channel, tuple(fields)))
+    return tuple(table)
+
+
+# Precompiled lookup table, used for parsing
+dump_table = _compile_dump_lut()
@@ -3,12 +3,14 @@ from .channel import Channel
 from .constants import DCX_HEADER, TERMINATOR_BYTE
 
 
-def _is_bit(byte, bit):
-    return bool(byte & (1 << bit))
+_PING_START = 8 + Channel.INPUT_A
+"""Index of the status byte of the first channel in a PING response"""
 
+_PING_COUNT = Channel.OUTPUT_6 - Channel.INPUT_A + 1
+"""Number of channel status bytes in a PING response"""
 
-def _clear_bit(byte, bit):
-    return byte & ~(1 << bit)
+_PING_ONES = int.from_bytes(b"\x01" * _PING_COUNT, "little")
+"""Bit 0 set in every status byte, used to split all status bytes at once"""
 
 
 class Response:
@@ -32,24 +34,39 @@ class DumpResponse(Response):
     LENGTH_PART0 = 1015
     LENGTH_PART1 = 911
 
+    def __init__(self, data: bytearray):
+        super().__init__(data)
+        if len(data) >= self.LENGTH_PART0:
+            part_0 = bytes(data[6 : self.LENGTH_PART0 - 1])
+        else:
+            part_0 = b""
+        if len(data) > self.LENGTH_PART0:
+            # Both parts are set
+            part_1 = bytes(data[self.LENGTH_PART0 + 6 : -1])
+        elif len(data) == self.LENGTH_PART1:
+            # Only second part set
+            part_1 = bytes(data[6:-1])
+        else:
+            part_1 = b""
+        # Strip headers and terminators once, all accessors return views into it
+        self._payload = memoryview(part_0 + part_1)
+        self._part_0_length = len(part_0)
+
     @property
     def payload(self):
-        return self.part_0 + self.part_1
+        """
+        Return the payload of both parts, meaning the data without headers and terminators
+        :return: memoryview
+        """
+        return self._payload
 
     @property
     def part_0(self):
-        return self.data[6 : self.LENGTH_PART0 - 1] if len(self.data) >= self.LENGTH_PART0 else bytearray()
+        return self._payload[: self._part_0_length]
 
     @property
     def part_1(self):
-        if len(self.data) > self.LENGTH_PART0:
-            # Both parts are set
-            return self.data[self.LENGTH_PART0 + 6 : -1]
-        elif len(self.data) == self.LENGTH_PART1:
-            # Only second part set
-            return super().payload
-        else:
-            return bytearray()
+        return self._payload[self._part_0_length :]
 
 
 class SearchResponse(Response):
@@ -72,15 +89,25 @@ class SearchResponse(Response):
 
 class PingResponse(Response):
     class _PingData:
-        def __init__(self, data):
-            self.limited = _is_bit(data, 5)
-            self.level = _clear_bit(data, 5)
+        def __init__(self, level, limited):
+            self.level = level
+            self.limited = limited
+
+    levels: bytes = None
+    """Level of all channels (INPUT_A ... OUTPUT_6)"""
 
-    channels: dict[Channel, _PingData] = {}
+    limited: bytes = None
+    """Limiter state (0 or 1) of all channels (INPUT_A ... OUTPUT_6)"""
 
     def __init__(self, data):
         assert len(data) == 25
         super().__init__(data)
-        start = 8
-        for channel in range(Channel.INPUT_A, Channel.OUTPUT_6 + 1):
-            self.channels[Channel(channel)] = self._PingData(self.data[start + channel])
+        # One status byte per channel, bit 5 is the limiter flag and the other bits are the level.
+        # Split all status bytes at once instead of byte by byte.
+        word = int.from_bytes(self.data[_PING_START : _PING_START + _PING_COUNT], "little")
+        self.levels = (word & ~(_PING_ONES << 5)).to_bytes(_PING_COUNT, "little")
+        self.limited = ((word >> 5) & _PING_ONES).to_bytes(_PING_COUNT, "little")
+        self.channels: dict[Channel, PingResponse._PingData] = {
+            Channel(channel): self._PingData(level, bool(limited))
+            for channel, level, limited in zip(range(Channel.INPUT_A, Channel.OUTPUT_6 + 1), self.levels, self.limited)
+        }